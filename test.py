@@ -1,37 +1,57 @@
 import yfinance as yf
 import pandas as pd
+import diskcache
 from datetime import datetime
 from typing import List, Union
+from pyrate_limiter import Duration, Limiter, RequestRate
+from tqdm.contrib.concurrent import thread_map
+
+# market caps barely move day to day, so remember them across runs
+_mcap_cache = diskcache.Cache(".yf_info_cache")
+
+# aggregate politeness budget shared by all lookup workers
+_yf_limiter = Limiter(RequestRate(5, Duration.SECOND))
 
 def filter_large_caps(tickers: List[str],
                       min_market_cap: float = 3e9,
-                      pause: float = 1.0,
+                      max_workers: int = 8,
                       max_retries: int=5
                       ) -> List[str]:
     """
     Returns the subset of `tickers` whose current marketCap ≥ min_market_cap.
 
+    Market caps are cached on disk for a day, so re-runs only hit Yahoo
+    for tickers not seen recently. Cold lookups run on a thread pool with
+    a shared 5-requests-per-second token bucket instead of one serial
+    sleep per ticker.
+
     Args:
       tickers: List of ticker symbols (e.g. ['AAPL','MSFT',...])
       min_market_cap: threshold in USD (default 3e9)
-      pause: seconds to wait between info calls to be polite
+      max_workers: threads issuing concurrent info lookups
 
     Returns:
       List of tickers passing the filter.
     """
-    large = []
-    for t in tickers:
-        try:
-            info = yf.Ticker(t).info
-            if info.get("marketCap", 0) >= min_market_cap:
-                large.append(t)
-        except Exception:
-            # skip symbols that error out
-            pass
-        finally:
-            # small sleep so you don’t get rate-limited
-            from time import sleep; sleep(pause)
-    return large
+    def _lookup(t: str) -> float:
+        mc = _mcap_cache.get(t)
+        if mc is None:
+            # block until the shared token bucket grants a slot
+            with _yf_limiter.ratelimit("yf", delay=True):
+                try:
+                    # yfinance reports null marketCap for symbols it
+                    # can't resolve; coerce so the cache and the
+                    # threshold compare both see a real number
+                    mc = yf.Ticker(t).info.get("marketCap") or 0
+                    _mcap_cache.set(t, mc, expire=86400)
+                except Exception:
+                    # skip symbols that error out
+                    mc = 0
+        return mc
+
+    # thread_map keeps input order, so results zip straight back to tickers
+    caps = thread_map(_lookup, tickers, max_workers=max_workers, desc="Checking market caps")
+    return [t for t, mc in zip(tickers, caps) if mc >= min_market_cap]
 
 
 def fetch_closing_prices(tickers: List[str],
@@ -77,11 +97,17 @@ def fetch_closing_prices(tickers: List[str],
 # ─── USAGE EXAMPLE ────────────────────────────────────────────────────────────
 
 if __name__ == "__main__":
-    # 1. Define your universe (e.g. S&P 500 tickers)
-    import pandas as pd
-    sp500 = pd.read_html(
-        "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
-    )[0]["Symbol"].tolist()
+    # 1. Define your universe (e.g. S&P 500 tickers), cached for a week
+    #    so startup skips the Wikipedia fetch + lxml parse
+    import json, pathlib, time
+    cache_file = pathlib.Path("sp500.json")
+    if cache_file.exists() and time.time() - cache_file.stat().st_mtime < 7 * 86400:
+        sp500 = json.loads(cache_file.read_text())
+    else:
+        sp500 = pd.read_html(
+            "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
+        )[0]["Symbol"].tolist()
+        cache_file.write_text(json.dumps(sp500))
 
     # 2. Filter for ≥ $3 billion market cap
     large_sp500 = filter_large_caps(sp500, min_market_cap=3e9)
@@ -93,6 +119,7 @@ if __name__ == "__main__":
         end=pd.Timestamp.today().strftime("%Y-%m-%d")
     )
 
-    # 4. Inspect or save
+    # 4. Inspect or save (parquet: ~10× smaller and much faster to write
+    #    than CSV for a large-cap × 10-year matrix)
     print(df_closes.tail())
-    df_closes.to_csv("yahoo_historical_closes.csv")
+    df_closes.to_parquet("yahoo_historical_closes.parquet", compression="zstd")